@@ -1,8 +1,16 @@
 import fitz  # PyMuPDF
 import json
+import os
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
+# Matches a single alphanumeric character (word characters minus underscore)
+_ALNUM_RE = re.compile(r"[^\W_]")
+
+# Precomputed heading level labels, indexed by level number
+_LEVEL_STR = tuple(f"H{i}" for i in range(10))
+
 
 def is_heading_nlp(text):
     """
@@ -19,7 +27,7 @@ def is_heading_nlp(text):
     if len(words) > 10:
         return False
     # Must have at least 3 alphanumeric characters
-    alnum_count = sum(1 for c in txt if c.isalnum())
+    alnum_count = len(_ALNUM_RE.findall(txt))
     if alnum_count < 3:
         return False
     cap = sum(1 for w in words if w and w[0].isupper())
@@ -34,60 +42,68 @@ def adjust_hierarchy(outline):
     """
     last_level = 0
     for node in outline:
-        orig = int(node.get('level', 'H1')[1])
+        orig = ord(node.get('level', 'H1')[1]) - 48  # single digit after 'H'
         if last_level == 0 and orig > 1:
             new = 1
         elif orig > last_level + 1:
             new = last_level + 1
         else:
             new = orig
-        node['level'] = f"H{new}"
+        node['level'] = _LEVEL_STR[new]
         last_level = new
     return outline
 
 
 def extract_pdf_structure(pdf_path):
-    doc = fitz.open(pdf_path)
+    doc = fitz.open(str(pdf_path), filetype="pdf")
     blocks = []
-    font_sizes = []
+    font_size_sum = 0.0
+    font_size_count = 0
+
+    print(f"Processing {Path(pdf_path).name}: {doc.page_count} pages")
 
     # Collect text blocks and style metrics
     for page_num, page in enumerate(doc):  # page numbers start at 0
-        print(f"Processing page {page_num}")
-        for blk in page.get_text("dict")["blocks"]:
-            if blk.get("type") != 0:
+        # Same flags as get_text("dict"): image blocks affect how MuPDF groups text lines
+        tp = page.get_textpage(flags=fitz.TEXTFLAGS_DICT)
+        page_blocks = tp.extractDICT()["blocks"]
+        tp = None  # release the MuPDF text page before processing spans
+        for blk in page_blocks:
+            if blk["type"] != 0:
                 continue
-            block_text = ""
+            text_parts = []
             max_font_size = 0
             bold_spans = 0
             italic_spans = 0
             total_spans = 0
-            for line in blk.get("lines", []):
-                for span in line.get("spans", []):
-                    text = span.get("text", "").strip()
+            for line in blk["lines"]:
+                for span in line["spans"]:
+                    text = span["text"].strip()
                     if not text:
                         continue
                     total_spans += 1
-                    font_name = span.get("font", "")
-                    if re.search(r"Bold", font_name, re.IGNORECASE):
+                    # Style bits from MuPDF: 2 = italic, 16 = bold
+                    flags = span["flags"]
+                    if flags & 16:
                         bold_spans += 1
-                    if re.search(r"Italic|Oblique", font_name, re.IGNORECASE):
+                    if flags & 2:
                         italic_spans += 1
-                    size = span.get("size", 0)
-                    font_sizes.append(size)
+                    size = span["size"]
+                    font_size_sum += size
+                    font_size_count += 1
                     max_font_size = max(max_font_size, size)
-                    block_text += text + " "
-            if block_text.strip():
+                    text_parts.append(text)
+            if text_parts:
                 blocks.append({
                     "page": page_num,
-                    "text": block_text.strip(),
+                    "text": " ".join(text_parts),
                     "font_size": max_font_size,
                     "bold_ratio": (bold_spans / total_spans) if total_spans else 0,
                     "italic_ratio": (italic_spans / total_spans) if total_spans else 0
                 })
 
     # Determine heading size threshold
-    avg_font = (sum(font_sizes) / len(font_sizes)) if font_sizes else 0
+    avg_font = (font_size_sum / font_size_count) if font_size_count else 0
     heading_thresh = avg_font + 1.5
 
     title = None
@@ -107,7 +123,7 @@ def extract_pdf_structure(pdf_path):
             continue
 
         # Filter out too-short or symbol-only text
-        alnum_count = sum(1 for c in txt if c.isalnum())
+        alnum_count = len(_ALNUM_RE.findall(txt))
         if alnum_count < 3 or len(txt) < 4:
             continue
 
@@ -125,18 +141,31 @@ def extract_pdf_structure(pdf_path):
     return {"title": title or "", "outline": outline}
 
 
+def _process_one(pdf_path: Path, output_dir: Path):
+    """
+    Worker entry point: extract one PDF and write its JSON outline.
+    The document is opened inside the worker, so only paths are pickled.
+    """
+    result = extract_pdf_structure(pdf_path)
+    out_file = output_dir / f"{pdf_path.stem}.json"
+    with open(out_file, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    return pdf_path.name, out_file.name
+
+
 def process_pdfs(input_dir: Path, output_dir: Path):
     output_dir.mkdir(parents=True, exist_ok=True)
     pdf_files = list(input_dir.glob("*.pdf"))
     if not pdf_files:
         print(f"No PDF files found in {input_dir}")
         return
-    for pdf in pdf_files:
-        result = extract_pdf_structure(pdf)
-        out_file = output_dir / f"{pdf.stem}.json"
-        with open(out_file, "w", encoding="utf-8") as f:
-            json.dump(result, f, indent=2, ensure_ascii=False)
-        print(f"Processed {pdf.name} -> {out_file.name}")
+    # Each PDF is independent, so parse them in parallel across processes
+    max_workers = min(len(pdf_files), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        futures = {ex.submit(_process_one, pdf, output_dir): pdf for pdf in pdf_files}
+        for future in as_completed(futures):
+            pdf_name, out_name = future.result()
+            print(f"Processed {pdf_name} -> {out_name}")
 
 
 if __name__ == "__main__":
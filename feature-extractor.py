@@ -1,24 +1,11 @@
 import sys
 import fitz  # PyMuPDF
 import csv
+import tempfile
+from array import array
 
-def convert_color_int_to_rgb(color_int):
-    """
-    Converts an sRGB integer color value to a more readable (R, G, B) tuple.
-
-    Args:
-        color_int (int): The integer representation of the color.
-
-    Returns:
-        tuple: An (R, G, B) tuple, or None if input is invalid.
-    """
-    if color_int is None:
-        return None
-    # The color is stored as a single integer, we decode it to R, G, B components
-    blue = color_int & 255
-    green = (color_int >> 8) & 255
-    red = (color_int >> 16) & 255
-    return (red, green, blue)
+# Buffer size for the CSV files, so rows reach the OS in large writes
+_CSV_BUFFER_SIZE = 1 << 20
 
 def get_style_signature(span):
     """
@@ -34,7 +21,7 @@ def get_style_signature(span):
     if not span:
         return None
     
-    flags = span.get("flags", 0)
+    flags = span["flags"]
     # Flag 1 is for underline.
     is_underline = bool(flags & 1)
     # Flag 2 is for italic.
@@ -43,15 +30,15 @@ def get_style_signature(span):
     is_bold = bool(flags & 16)
     
     # Check if the text is all uppercase.
-    text = span.get("text", "").strip()
+    text = span["text"].strip()
     is_all_caps = text.isupper() and any(c.isalpha() for c in text)
 
     # The signature is a combination of all relevant style properties.
     # We round font size to handle minor floating point variations.
     signature = (
-        span.get("font", "Unknown"),
-        round(span.get("size", 0), 2),
-        span.get("color"),
+        span["font"],
+        round(span["size"], 2),
+        span["color"],  # sRGB integer
         is_bold,
         is_italic,
         is_underline,
@@ -59,19 +46,107 @@ def get_style_signature(span):
     )
     return signature
 
-def normalize_value(value, min_val, max_val):
+def normalize_column(values, ndigits=4):
     """
-    Normalizes a value to a 0-1 scale using min-max normalization.
+    Normalizes a column of values to a 0-1 scale using min-max normalization.
+
+    Args:
+        values (array): A column of numeric feature values.
+        ndigits (int): Decimal places to round the normalized values to.
+
+    Returns:
+        array: The normalized column, in the same order as the input.
     """
+    min_val, max_val = min(values), max(values)
     if max_val == min_val:
-        return 0.0  # Avoid division by zero if all values are the same
-    return (value - min_val) / (max_val - min_val)
+        return array('d', [0.0]) * len(values)  # Avoid division by zero if all values are the same
+    value_range = max_val - min_val
+    return array('d', [round((value - min_val) / value_range, ndigits) for value in values])
+
+def merge_styled_lines(blocks):
+    """
+    Merges consecutive lines with identical style signatures into text blocks.
+
+    Args:
+        blocks (list): The block dictionaries of one page from PyMuPDF.
+
+    Yields:
+        tuple: (text, style_signature, (x0, y0, x1, y1)) for each merged block.
+    """
+    current_parts = []
+    current_style_sig = None
+    current_bbox = None
+
+    for block in blocks:
+        if block['type'] == 0:  # Text block
+            for line in block["lines"]:
+                # The longest non-empty span decides the line's style
+                longest_span = None
+                longest_len = 0
+                spans = line["spans"]
+                for span in spans:
+                    span_len = len(span["text"].strip())
+                    if span_len > longest_len:
+                        longest_span, longest_len = span, span_len
+                if longest_span is None: continue
+
+                line_style_sig = get_style_signature(longest_span)
+                line_text = "".join(span["text"] for span in spans).strip()
+                line_bbox = line["bbox"]
+
+                if line_style_sig == current_style_sig:
+                    current_parts.append(line_text)
+                    # Grow the (x0, y0, x1, y1) bbox to include this line. Like
+                    # fitz.Rect.include_rect, empty rects are ignored and an empty
+                    # block bbox is replaced by the line's bbox.
+                    if line_bbox[0] < line_bbox[2] and line_bbox[1] < line_bbox[3]:
+                        if current_bbox[0] >= current_bbox[2] or current_bbox[1] >= current_bbox[3]:
+                            current_bbox = list(line_bbox)
+                        else:
+                            if line_bbox[0] < current_bbox[0]: current_bbox[0] = line_bbox[0]
+                            if line_bbox[1] < current_bbox[1]: current_bbox[1] = line_bbox[1]
+                            if line_bbox[2] > current_bbox[2]: current_bbox[2] = line_bbox[2]
+                            if line_bbox[3] > current_bbox[3]: current_bbox[3] = line_bbox[3]
+                else:
+                    if current_parts:
+                        yield " ".join(current_parts), current_style_sig, tuple(current_bbox)
+                    current_style_sig = line_style_sig
+                    current_parts = [line_text]
+                    current_bbox = list(line_bbox)
+
+    if current_parts:
+        yield " ".join(current_parts), current_style_sig, tuple(current_bbox)
+
+def with_vertical_spacing(merged_blocks, page_height):
+    """
+    Attaches the space above and below to each merged block in a single pass.
+    A block is held back until the next one arrives, since the gap between the
+    two is both the earlier block's space below and the later block's space above.
+
+    Args:
+        merged_blocks (iterable): (text, style_signature, bbox) tuples in page order.
+        page_height (float): Height of the page, used for the last block's space below.
+
+    Yields:
+        tuple: (text, style_signature, bbox, space_above, space_below)
+    """
+    pending = None
+    prev_y1 = 0.0  # the first block's space above is measured from the page top
+    for text, style, bbox in merged_blocks:
+        gap = bbox[1] - prev_y1
+        if pending:
+            yield pending + (gap,)
+        pending = (text, style, bbox, gap)
+        prev_y1 = bbox[3]
+    if pending:
+        yield pending + (page_height - prev_y1,)
 
 def extract_and_process_pdf(pdf_path, csv_path):
     """
-    Performs a two-pass process on a PDF. First, it gathers all text block data
-    to find min/max values for normalization. Second, it calculates normalized
-    values and writes the complete, ML-ready data to a CSV file.
+    Performs a two-pass process on a PDF. First, it streams every text block's
+    raw features to a temporary CSV while collecting the columns needed for
+    normalization. Second, it merges the normalized values into those rows and
+    writes the complete, ML-ready data to a CSV file.
 
     Args:
         pdf_path (str): The file path to the PDF document.
@@ -79,154 +154,114 @@ def extract_and_process_pdf(pdf_path, csv_path):
     """
     doc = None
     try:
-        doc = fitz.open(pdf_path)
+        doc = fitz.open(str(pdf_path), filetype="pdf")
         print(f"Successfully opened '{pdf_path}'")
         print(f"Number of pages: {doc.page_count}\n")
         print("-" * 30)
-        
-        # --- PASS 1: Gather all data to determine normalization ranges ---
-        print("Starting Pass 1: Analyzing document structure...")
-        all_blocks_raw_data = []
-        for page_num, page in enumerate(doc, 1):
-            page_width = page.rect.width
-            page_height = page.rect.height
-            
-            blocks = page.get_text("dict").get("blocks", [])
-            if not blocks:
-                continue
-
-            # Merge lines with identical styles for the current page
-            merged_blocks_on_page = []
-            current_text = ""
-            current_style_sig = None
-            current_bbox = None
-
-            for block in blocks:
-                if block['type'] == 0:  # Text block
-                    for line in block.get("lines", []):
-                        spans = line.get("spans", [])
-                        if not spans: continue
-                        
-                        longest_span = max(spans, key=lambda s: len(s.get("text", "").strip()), default=None)
-                        if not longest_span or not longest_span.get("text", "").strip(): continue
-
-                        line_style_sig = get_style_signature(longest_span)
-                        line_text = "".join(span.get("text", "") for span in spans).strip()
-                        line_bbox = fitz.Rect(line["bbox"])
-
-                        if line_style_sig == current_style_sig:
-                            current_text += " " + line_text
-                            current_bbox.include_rect(line_bbox)
-                        else:
-                            if current_text:
-                                merged_blocks_on_page.append({"text": current_text, "style": current_style_sig, "bbox": current_bbox})
-                            current_style_sig = line_style_sig
-                            current_text = line_text
-                            current_bbox = fitz.Rect(line_bbox)
-            
-            if current_text:
-                merged_blocks_on_page.append({"text": current_text, "style": current_style_sig, "bbox": current_bbox})
-
-            # Calculate raw spacing values for the page and store all data
-            for i, block_data in enumerate(merged_blocks_on_page):
-                block_data['page_num'] = page_num
-                block_data['page_width'] = page_width
-                block_data['page_height'] = page_height
-                
-                # Calculate raw space values
-                bbox = block_data["bbox"]
-                block_data['space_left'] = bbox.x0
-                block_data['space_right'] = page_width - bbox.x1
-                block_data['space_above'] = bbox.y0 if i == 0 else bbox.y0 - merged_blocks_on_page[i-1]["bbox"].y1
-                block_data['space_below'] = page_height - bbox.y1 if i == len(merged_blocks_on_page) - 1 else merged_blocks_on_page[i+1]["bbox"].y0 - bbox.y1
-                
-                all_blocks_raw_data.append(block_data)
-
-        if not all_blocks_raw_data:
-            print("No text content found in the PDF.")
-            return
-
-        # --- Calculate Min/Max for normalization ---
-        font_sizes = [b['style'][1] for b in all_blocks_raw_data]
-        spaces_above = [b['space_above'] for b in all_blocks_raw_data]
-        spaces_below = [b['space_below'] for b in all_blocks_raw_data]
-        spaces_left = [b['space_left'] for b in all_blocks_raw_data]
-        spaces_right = [b['space_right'] for b in all_blocks_raw_data]
-
-        min_font, max_font = min(font_sizes), max(font_sizes)
-        min_sa, max_sa = min(spaces_above), max(spaces_above)
-        min_sb, max_sb = min(spaces_below), max(spaces_below)
-        min_sl, max_sl = min(spaces_left), max(spaces_left)
-        min_sr, max_sr = min(spaces_right), max(spaces_right)
-        
-        # --- PASS 2: Normalize data and write to CSV ---
-        print("Starting Pass 2: Normalizing data and writing to CSV...")
-        with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-            csv_writer = csv.writer(csvfile)
-            # Reordered header with ML-relevant columns first
-            csv_writer.writerow([
-                'page_number', 'is_bold', 'is_italic', 'is_underline', 'is_all_caps', 
-                'is_centered', 'contains_number', 'contains_fullstop', 'word_count', 
-                'norm_font_size', 'norm_space_above', 'norm_space_below', 
-                'norm_space_left', 'norm_space_right', 'norm_r', 'norm_g', 'norm_b', 
-                'norm_x0', 'norm_y0', 'norm_x1', 'norm_y1', 
-                'font', 'font_size', 'color_rgb', 'x0', 'y0', 'x1', 'y1', 
-                'space_above', 'space_below', 'space_left', 'space_right', 'text'
-            ])
-
-            for block_data in all_blocks_raw_data:
-                text = block_data["text"]
-                style = block_data["style"]
-                bbox = block_data["bbox"]
-                font, size, color_int, bold, italic, underline, all_caps = style
-                
-                # Normalize positional and style values
-                norm_font_size = normalize_value(size, min_font, max_font)
-                norm_sa = normalize_value(block_data['space_above'], min_sa, max_sa)
-                norm_sb = normalize_value(block_data['space_below'], min_sb, max_sb)
-                norm_sl = normalize_value(block_data['space_left'], min_sl, max_sl)
-                norm_sr = normalize_value(block_data['space_right'], min_sr, max_sr)
-                
-                # Normalize coordinates by page dimensions
-                page_width = block_data['page_width']
-                page_height = block_data['page_height']
-                norm_x0 = bbox.x0 / page_width if page_width else 0
-                norm_y0 = bbox.y0 / page_height if page_height else 0
-                norm_x1 = bbox.x1 / page_width if page_width else 0
-                norm_y1 = bbox.y1 / page_height if page_height else 0
-
-                # Other properties
-                contains_number = any(char.isdigit() for char in text)
-                contains_fullstop = '.' in text
-                word_count = len(text.split())
-                is_centered = abs(block_data['space_left'] - block_data['space_right']) < 5
-                
-                # Color conversion and normalization
-                color_rgb = convert_color_int_to_rgb(color_int)
-                if color_rgb:
-                    color_str = f"({color_rgb[0]}, {color_rgb[1]}, {color_rgb[2]})"
-                    norm_r = color_rgb[0] / 255.0
-                    norm_g = color_rgb[1] / 255.0
-                    norm_b = color_rgb[2] / 255.0
-                else:
-                    color_str = "(0, 0, 0)"
-                    norm_r, norm_g, norm_b = 0.0, 0.0, 0.0
 
-                # Write the final row in the new order
+        with tempfile.TemporaryFile('w+', buffering=_CSV_BUFFER_SIZE, newline='', encoding='utf-8') as tmpfile:
+            # --- PASS 1: Stream raw rows and gather normalization columns ---
+            print("Starting Pass 1: Analyzing document structure...")
+            tmp_writer = csv.writer(tmpfile)
+            # Only the numeric features that need min/max are kept in memory
+            font_sizes = array('d')
+            spaces_above = array('d')
+            spaces_below = array('d')
+            spaces_left = array('d')
+            spaces_right = array('d')
+            for page_num, page in enumerate(doc, 1):
+                page_width = page.rect.width
+                page_height = page.rect.height
+
+                # Same flags as get_text("dict"): image blocks affect how MuPDF groups text lines
+                tp = page.get_textpage(flags=fitz.TEXTFLAGS_DICT)
+                blocks = tp.extractDICT()["blocks"]
+                tp = None  # release the MuPDF text page early
+                if not blocks:
+                    continue
+
+                # Merge lines by style and calculate raw spacing in one pass over the page,
+                # then write every non-normalized column
+                merged_blocks = merge_styled_lines(blocks)
+                for text, style, bbox, space_above, space_below in with_vertical_spacing(merged_blocks, page_height):
+                    x0, y0, x1, y1 = bbox
+                    font, size, color_int, bold, italic, underline, all_caps = style
+
+                    # Calculate raw space values
+                    space_left = x0
+                    space_right = page_width - x1
+                    font_sizes.append(size)
+                    spaces_above.append(space_above)
+                    spaces_below.append(space_below)
+                    spaces_left.append(space_left)
+                    spaces_right.append(space_right)
+
+                    # Normalize coordinates by page dimensions
+                    norm_x0 = x0 / page_width if page_width else 0
+                    norm_y0 = y0 / page_height if page_height else 0
+                    norm_x1 = x1 / page_width if page_width else 0
+                    norm_y1 = y1 / page_height if page_height else 0
+
+                    # Other properties
+                    contains_number = any(map(str.isdigit, text))
+                    contains_fullstop = '.' in text
+                    word_count = len(text.split())
+                    is_centered = abs(space_left - space_right) < 5
+
+                    # Decode the sRGB integer color into R, G, B components and normalize
+                    red = (color_int >> 16) & 255
+                    green = (color_int >> 8) & 255
+                    blue = color_int & 255
+                    color_str = f"({red}, {green}, {blue})"
+                    norm_r = red / 255.0
+                    norm_g = green / 255.0
+                    norm_b = blue / 255.0
+
+                    # The normalized feature columns are spliced in after word_count in pass 2
+                    tmp_writer.writerow([
+                        page_num, int(bold), int(italic), int(underline), int(all_caps),
+                        int(is_centered), int(contains_number), int(contains_fullstop), word_count,
+                        round(norm_r, 4), round(norm_g, 4), round(norm_b, 4),
+                        round(norm_x0, 4), round(norm_y0, 4), round(norm_x1, 4), round(norm_y1, 4),
+                        font, size, color_str,
+                        round(x0, 2), round(y0, 2), round(x1, 2), round(y1, 2),
+                        round(space_above, 2), round(space_below, 2),
+                        round(space_left, 2), round(space_right, 2),
+                        text
+                    ])
+
+            if not font_sizes:
+                print("No text content found in the PDF.")
+                return
+
+            # --- Normalize (and round) each numeric feature column in one go ---
+            norm_columns = [
+                normalize_column(column)
+                for column in (font_sizes, spaces_above, spaces_below, spaces_left, spaces_right)
+            ]
+
+            # --- PASS 2: Merge normalized values into the raw rows and write to CSV ---
+            print("Starting Pass 2: Normalizing data and writing to CSV...")
+            tmpfile.seek(0)
+            with open(csv_path, 'w', buffering=_CSV_BUFFER_SIZE, newline='', encoding='utf-8') as csvfile:
+                csv_writer = csv.writer(csvfile)
+                # Reordered header with ML-relevant columns first
                 csv_writer.writerow([
-                    block_data['page_num'], int(bold), int(italic), int(underline), int(all_caps),
-                    int(is_centered), int(contains_number), int(contains_fullstop), word_count,
-                    round(norm_font_size, 4), round(norm_sa, 4), round(norm_sb, 4),
-                    round(norm_sl, 4), round(norm_sr, 4),
-                    round(norm_r, 4), round(norm_g, 4), round(norm_b, 4),
-                    round(norm_x0, 4), round(norm_y0, 4), round(norm_x1, 4), round(norm_y1, 4),
-                    font, size, color_str, 
-                    round(bbox.x0, 2), round(bbox.y0, 2), round(bbox.x1, 2), round(bbox.y1, 2),
-                    round(block_data['space_above'], 2), round(block_data['space_below'], 2), 
-                    round(block_data['space_left'], 2), round(block_data['space_right'], 2), 
-                    text
+                    'page_number', 'is_bold', 'is_italic', 'is_underline', 'is_all_caps', 
+                    'is_centered', 'contains_number', 'contains_fullstop', 'word_count', 
+                    'norm_font_size', 'norm_space_above', 'norm_space_below', 
+                    'norm_space_left', 'norm_space_right', 'norm_r', 'norm_g', 'norm_b', 
+                    'norm_x0', 'norm_y0', 'norm_x1', 'norm_y1', 
+                    'font', 'font_size', 'color_rgb', 'x0', 'y0', 'x1', 'y1', 
+                    'space_above', 'space_below', 'space_left', 'space_right', 'text'
                 ])
 
+                # Write the final rows in the new order
+                csv_writer.writerows(
+                    row[:9] + list(norm_values) + row[9:]
+                    for row, norm_values in zip(csv.reader(tmpfile), zip(*norm_columns))
+                )
+
     except FileNotFoundError:
         print(f"Error: The file '{pdf_path}' was not found.")
     except Exception as e: